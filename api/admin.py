@@ -1,57 +1,192 @@
+from functools import reduce
+from operator import or_
+
 from django.contrib import admin
-from .models import User, Profile, Product, Wishlist, CartItem, Order, OrderItem
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+from .models import (
+    User, Profile, Product, Wishlist, CartItem, Order, OrderItem, ArchivedOrder, ArchivedOrderItem, RequestProfile,
+)
+from .profiling import make_profiling_token
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Use PostgreSQL's row estimate instead of COUNT(*) for unfiltered
+    changelists on big tables. Filtered lists and other databases still
+    get an exact count.
+    """
+    estimate_threshold = 100000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples FROM pg_class WHERE relname = %s",
+                    [queryset.model._meta.db_table]
+                )
+                row = cursor.fetchone()
+            if row and row[0] >= self.estimate_threshold:
+                return int(row[0])
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist settings for tables that grow with orders and users."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    # Integer fields matched exactly when the search term is a number. Django's
+    # own "=id" search casts the column to text, which no index can serve.
+    search_id_fields = ()
+
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        term = search_term.strip()
+        if term.isdigit() and self.search_id_fields:
+            results |= queryset.filter(reduce(or_, (Q(**{field: int(term)}) for field in self.search_id_fields)))
+        return results, may_have_duplicates
+
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
     list_display = ('username', 'email', 'role', 'is_blocked', 'is_staff', 'is_active')
     list_filter = ('role', 'is_blocked', 'is_staff', 'is_active')
-    search_fields = ('username', 'email')
+    search_fields = ('^username', '^email')
     ordering = ('username',)
 
 @admin.register(Profile)
-class ProfileAdmin(admin.ModelAdmin):
+class ProfileAdmin(LargeTableAdmin):
     list_display = ('user', 'phone', 'address')
-    search_fields = ('user__username', 'phone')
+    list_select_related = ('user',)
+    search_fields = ('^user__username', '=phone')
+    autocomplete_fields = ('user',)
 
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     list_display = ('title', 'price', 'room', 'stock', 'is_archived', 'created_at')
     list_filter = ('room', 'is_archived', 'created_at')
-    search_fields = ('title', 'room')
+    search_fields = ('^title', '^room')
     ordering = ('-created_at',)
     list_editable = ('price', 'stock', 'is_archived')
 
 
 
 @admin.register(Wishlist)
-class WishlistAdmin(admin.ModelAdmin):
+class WishlistAdmin(LargeTableAdmin):
     list_display = ('user', 'product')
-    search_fields = ('user__username', 'product__title')
+    list_select_related = ('user', 'product')
+    search_fields = ('^user__username', '^product__title')
+    autocomplete_fields = ('user', 'product')
 
 
 
 @admin.register(CartItem)
-class CartItemAdmin(admin.ModelAdmin):
+class CartItemAdmin(LargeTableAdmin):
     list_display = ('user', 'product', 'quantity')
-    search_fields = ('user__username', 'product__title')
+    list_select_related = ('user', 'product')
+    search_fields = ('^user__username', '^product__title')
+    autocomplete_fields = ('user', 'product')
 
 
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
+    autocomplete_fields = ('product',)
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(LargeTableAdmin):
     list_display = ('id', 'user', 'total', 'status', 'payment_method', 'date')
     list_filter = ('status', 'payment_method', 'date')
-    search_fields = ('user__username', 'id')
+    list_select_related = ('user',)
+    search_fields = ('^user__username',)
+    search_id_fields = ('id',)
+    autocomplete_fields = ('user',)
+    ordering = ('-id',)
     inlines = [OrderItemInline]
 
 
 @admin.register(OrderItem)
-class OrderItemAdmin(admin.ModelAdmin):
+class OrderItemAdmin(LargeTableAdmin):
     list_display = ('order', 'product', 'quantity')
-    search_fields = ('order__id', 'product__title')
+    # Order.__str__ uses the username, so join the order's user as well
+    list_select_related = ('order__user', 'product')
+    search_fields = ('^product__title',)
+    search_id_fields = ('order_id',)
+    autocomplete_fields = ('order', 'product')
+
+
+class ArchivedOrderItemInline(admin.TabularInline):
+    model = ArchivedOrderItem
+    extra = 0
+    can_delete = False
+    readonly_fields = ('product', 'title', 'price', 'quantity')
+
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'total', 'status', 'date', 'archived_at')
+    list_filter = ('date',)
+    list_select_related = ('user',)
+    search_fields = ('^user__username',)
+    search_id_fields = ('id',)
+    ordering = ('-id',)
+    readonly_fields = ('id', 'user', 'total', 'address', 'payment_method', 'status', 'date', 'archived_at')
+    inlines = [ArchivedOrderItemInline]
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    """
+    Captured profiles. `token/` returns a signed X-Profile header value that
+    forces profiling of a request; `<id>/download/` returns folded stacks for
+    flamegraph.pl or speedscope.
+    """
+    list_display = ('created_at', 'method', 'path', 'status_code', 'duration_ms', 'query_count', 'samples', 'download')
+    list_filter = ('method', 'status_code')
+    search_fields = ('^path',)
+    ordering = ('-id',)
+    readonly_fields = [field.name for field in RequestProfile._meta.fields] + ['download']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path('token/', self.admin_site.admin_view(self.token_view), name='api_requestprofile_token'),
+            path('<int:pk>/download/', self.admin_site.admin_view(self.download_view), name='api_requestprofile_download'),
+        ] + super().get_urls()
+
+    @admin.display(description='Flamegraph')
+    def download(self, obj):
+        return format_html('<a href="{}">stacks</a>', reverse('admin:api_requestprofile_download', args=[obj.pk]))
+
+    def token_view(self, request):
+        if not request.user.is_superuser:
+            return HttpResponse(status=403)
+        return HttpResponse(make_profiling_token(), content_type='text/plain')
+
+    def download_view(self, request, pk):
+        if not self.has_view_permission(request):
+            return HttpResponse(status=403)
+        record = get_object_or_404(RequestProfile, pk=pk)
+        response = HttpResponse(record.stacks, content_type='text/plain')
+        response['Content-Disposition'] = f'attachment; filename="profile-{record.pk}.folded"'
+        return response
@@ -0,0 +1,54 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Order, OrderItem, ArchivedOrder, ArchivedOrderItem
+
+
+def archive_orders(months, batch_size=500):
+    """
+    Move Delivered orders older than `months` months into the archive tables.
+
+    Each batch is copied and deleted in one transaction. Returns the number
+    of orders archived.
+    """
+    cutoff = timezone.now() - timedelta(days=30 * months)
+    archived = 0
+    while True:
+        with transaction.atomic():
+            orders = list(
+                Order.objects.select_for_update()
+                .filter(status='Delivered', date__lt=cutoff)
+                .order_by('id')[:batch_size]
+            )
+            if not orders:
+                break
+            items = OrderItem.objects.filter(order__in=orders).select_related('product')
+
+            ArchivedOrder.objects.bulk_create([
+                ArchivedOrder(
+                    id=order.id,
+                    user_id=order.user_id,
+                    total=order.total,
+                    address=order.address,
+                    payment_method=order.payment_method,
+                    status=order.status,
+                    date=order.date,
+                )
+                for order in orders
+            ])
+            ArchivedOrderItem.objects.bulk_create([
+                ArchivedOrderItem(
+                    id=item.id,
+                    order_id=item.order_id,
+                    product_id=item.product_id,
+                    title=item.product.title,
+                    price=item.product.price,
+                    quantity=item.quantity,
+                )
+                for item in items
+            ])
+            Order.objects.filter(id__in=[order.id for order in orders]).delete()
+        archived += len(orders)
+    return archived
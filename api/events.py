@@ -0,0 +1,160 @@
+import asyncio
+import json
+import threading
+
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+TOKEN_SALT = 'api.events'
+
+
+class InProcessSubscription:
+    def __init__(self, broker, channels):
+        self._broker = broker
+        self._channels = channels
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=settings.EVENTS_QUEUE_SIZE)
+
+    def offer(self, message):
+        # Called on the subscriber's loop; a client that stops reading loses
+        # old events rather than growing the queue forever.
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            pass
+
+    async def open(self):
+        # Registered with the broker in subscribe(), so there is nothing to wait for.
+        pass
+
+    async def get(self, timeout=None):
+        """Next message, or None if nothing arrives within `timeout` seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self):
+        self._broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """
+    Fans events out to subscribers in this process only. Changes made by other
+    processes (other workers, the admin under WSGI, management commands) never arrive.
+    Used for tests and single-process setups.
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, message)
+            except RuntimeError:
+                # The subscriber's event loop has already closed.
+                pass
+
+    def subscribe(self, channels):
+        subscription = InProcessSubscription(self, channels)
+        with self._lock:
+            for channel in channels:
+                self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription._channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+
+class RedisSubscription:
+    def __init__(self, url, channels):
+        import redis.asyncio
+
+        self._client = redis.asyncio.Redis.from_url(url)
+        self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        self._channels = channels
+
+    async def open(self):
+        """Subscribe on the server; messages published after this returns are delivered."""
+        await self._pubsub.subscribe(*self._channels)
+
+    async def get(self, timeout=None):
+        message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+        if message is None:
+            return None
+        return json.loads(message['data'])
+
+    async def close(self):
+        await self._pubsub.aclose()
+        await self._client.aclose()
+
+
+class RedisBroker:
+    """Redis pub/sub, so events reach clients connected to any node. Needs the `redis` package."""
+
+    def __init__(self):
+        import redis
+
+        self._url = settings.EVENTS_REDIS_URL
+        self._client = redis.Redis.from_url(self._url)
+
+    def publish(self, channel, message):
+        self._client.publish(channel, json.dumps(message))
+
+    def subscribe(self, channels):
+        return RedisSubscription(self._url, channels)
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        _broker = import_string(settings.EVENTS_BROKER)()
+    return _broker
+
+
+def make_events_token(user):
+    """
+    Short-lived signed token for `?token=` on /api/events/, since EventSource
+    can't send an Authorization header. Valid for EVENTS_TOKEN_MAX_AGE seconds.
+    """
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(str(user.pk))
+
+
+def user_id_from_events_token(value):
+    """The user id signed into `value`, or None if it is invalid or expired."""
+    try:
+        return int(signing.TimestampSigner(salt=TOKEN_SALT).unsign(value, max_age=settings.EVENTS_TOKEN_MAX_AGE))
+    except (signing.BadSignature, ValueError):
+        return None
+
+
+def order_channel(order_id):
+    return f"order:{order_id}"
+
+
+def product_channel(product_id):
+    return f"product:{product_id}"
+
+
+def publish_on_commit(channel, message):
+    """
+    Publish once the current transaction commits, so clients never see rolled back changes.
+    The change is already saved by then, so a broker outage is logged rather than raised.
+    """
+    transaction.on_commit(lambda: get_broker().publish(channel, message), robust=True)
@@ -0,0 +1,82 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+
+IDEMPOTENCY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+
+
+def _cache_key(request, key):
+    """Scope the client key to the user and endpoint so keys can't collide."""
+    digest = hashlib.sha256(f"{request.user.pk}:{request.path}:{key}".encode()).hexdigest()
+    return f"idempotency:{digest}"
+
+
+def _payload_hash(request):
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class IdempotentCreateMixin:
+    """
+    Support the `Idempotency-Key` header on create.
+
+    A successful response is stored in the shared cache for IDEMPOTENCY_KEY_TTL
+    seconds, together with a hash of the request body. Retries with the same
+    key and body get the stored response back without running perform_create
+    again. Reusing a key with a different body is rejected with a 422. A retry
+    that arrives while the first request is still running gets a 409 instead
+    of starting a second checkout.
+    """
+
+    def _replay(self, stored, payload_hash):
+        stored_hash, status_code, data = stored
+        if stored_hash != payload_hash:
+            return Response(
+                {'error': 'This Idempotency-Key was already used with a different request body'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        response = Response(data, status=status_code)
+        response['Idempotent-Replayed'] = 'true'
+        return response
+
+    def create(self, request, *args, **kwargs):
+        key = request.META.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return super().create(request, *args, **kwargs)
+
+        cache = caches['shared']
+        cache_key = _cache_key(request, key)
+        payload_hash = _payload_hash(request)
+        stored = cache.get(cache_key)
+        if stored is not None:
+            return self._replay(stored, payload_hash)
+
+        lock_key = f"{cache_key}:lock"
+        if not cache.add(lock_key, 1, timeout=settings.IDEMPOTENCY_LOCK_TIMEOUT):
+            return Response(
+                {'error': 'A request with this Idempotency-Key is already in progress'},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        try:
+            # The first request may have finished between the lookup above and taking the lock.
+            stored = cache.get(cache_key)
+            if stored is not None:
+                return self._replay(stored, payload_hash)
+            response = super().create(request, *args, **kwargs)
+            if status.is_success(response.status_code):
+                cache.set(
+                    cache_key,
+                    (payload_hash, response.status_code, response.data),
+                    timeout=settings.IDEMPOTENCY_KEY_TTL
+                )
+        finally:
+            cache.delete(lock_key)
+        return response
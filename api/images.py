@@ -0,0 +1,131 @@
+import hashlib
+from datetime import timedelta
+from io import BytesIO
+from urllib.parse import urlparse
+from urllib.error import HTTPError, URLError
+from urllib.request import urlopen
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ImageAsset
+
+
+def enqueue_image(url):
+    """Return the ImageAsset for `url`, creating a pending one for process_images if needed."""
+    asset, _ = ImageAsset.objects.get_or_create(source_url=url)
+    return asset
+
+
+def _claimable(now):
+    stale = now - timedelta(seconds=settings.IMAGE_CLAIM_TIMEOUT)
+    due = Q(retry_at__isnull=True) | Q(retry_at__lte=now)
+    return (Q(status='pending') & due) | Q(status='processing', claimed_at__lt=stale)
+
+
+def claim_image(asset_id):
+    """
+    Atomically mark an asset as taken by this worker. Returns False if another
+    worker got there first; claims older than IMAGE_CLAIM_TIMEOUT are up for grabs.
+    """
+    now = timezone.now()
+    return ImageAsset.objects.filter(_claimable(now), pk=asset_id).update(status='processing', claimed_at=now) == 1
+
+
+def claimable_images():
+    return ImageAsset.objects.filter(_claimable(timezone.now()))
+
+
+def _is_transient(exc):
+    if isinstance(exc, HTTPError):
+        return exc.code >= 500 or exc.code == 429
+    return isinstance(exc, (URLError, TimeoutError, ConnectionError))
+
+
+def _fetch(url):
+    scheme = urlparse(url).scheme
+    allowed = list(settings.IMAGE_SOURCE_SCHEMES) + (['file'] if settings.IMAGE_ALLOW_FILE_URLS else [])
+    if scheme not in allowed:
+        raise ValueError(f"Unsupported image URL scheme: {scheme}")
+    with urlopen(url, timeout=settings.IMAGE_FETCH_TIMEOUT) as response:
+        data = response.read(settings.IMAGE_MAX_SOURCE_BYTES + 1)
+    if len(data) > settings.IMAGE_MAX_SOURCE_BYTES:
+        raise ValueError("Image is larger than IMAGE_MAX_SOURCE_BYTES")
+    return data
+
+
+def _save(path, data):
+    # Names are content hashed, so an existing file already holds these bytes.
+    if not default_storage.exists(path):
+        default_storage.save(path, ContentFile(data))
+    return path
+
+
+def _variant_widths(image_width):
+    """Configured widths below the original, plus one capped at the original so we never upscale."""
+    widths = {width for width in settings.IMAGE_VARIANT_WIDTHS if width < image_width}
+    widths.add(min(image_width, max(settings.IMAGE_VARIANT_WIDTHS)))
+    return sorted(widths)
+
+
+def process_image(asset):
+    """
+    Download the source image, store it and build the resized variants.
+    Network and server errors put the asset back in the queue for a later retry.
+    """
+    from PIL import Image, features
+
+    try:
+        data = _fetch(asset.source_url)
+        digest = hashlib.sha256(data).hexdigest()[:16]
+        image = Image.open(BytesIO(data))
+        image.load()
+        asset.original = _save(f"images/{digest}.{(image.format or 'img').lower()}", data)
+        image = image.convert('RGBA' if image.has_transparency_data else 'RGB')
+
+        variants = {}
+        for fmt in settings.IMAGE_VARIANT_FORMATS:
+            if not features.check(fmt):
+                continue
+            variants[fmt] = {}
+            for width in _variant_widths(image.width):
+                height = max(1, round(image.height * width / image.width))
+                buffer = BytesIO()
+                image.resize((width, height), Image.LANCZOS).save(buffer, format=fmt.upper())
+                variants[fmt][str(width)] = _save(f"images/{digest}-{width}w.{fmt}", buffer.getvalue())
+
+        asset.content_hash = digest
+        asset.variants = variants
+        asset.status = 'ready'
+        asset.error = ''
+        asset.retry_at = None
+    except Exception as exc:
+        asset.error = str(exc)
+        asset.attempts += 1
+        if _is_transient(exc) and asset.attempts < settings.IMAGE_MAX_ATTEMPTS:
+            asset.status = 'pending'
+            asset.retry_at = timezone.now() + timedelta(seconds=settings.IMAGE_RETRY_BACKOFF * 2 ** (asset.attempts - 1))
+        else:
+            asset.status = 'failed'
+            asset.retry_at = None
+    asset.save()
+    return asset
+
+
+def image_srcset(asset):
+    """URLs for a ready asset, shaped for <picture>/<img srcset>; None until processed."""
+    if asset is None or asset.status != 'ready':
+        return None
+    return {
+        'original': default_storage.url(asset.original),
+        'srcset': {
+            fmt: ", ".join(
+                f"{default_storage.url(path)} {width}w"
+                for width, path in sorted(paths.items(), key=lambda item: int(item[0]))
+            )
+            for fmt, paths in asset.variants.items()
+        },
+    }
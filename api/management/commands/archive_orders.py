@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.archive import archive_orders
+
+
+class Command(BaseCommand):
+    help = "Move old Delivered orders into the ArchivedOrder/ArchivedOrderItem tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=settings.ORDER_ARCHIVE_AFTER_MONTHS)
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        count = archive_orders(options['months'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Archived {count} orders"))
@@ -0,0 +1,132 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Points the child at the benchmark database before Django configures its connections.
+USE_DATABASE = """
+from django.conf import settings
+settings.DATABASES['default']['NAME'] = sys.argv[2]
+settings.DATABASE_REPLICAS = []
+"""
+
+MIGRATE_SCRIPT = "import sys" + USE_DATABASE + """
+import django
+from django.core.management import call_command
+django.setup()
+call_command('migrate', verbosity=0)
+"""
+
+# Runs in a fresh interpreter so nothing is already imported.
+CHILD_SCRIPT = """
+import json, resource, sys, time
+from wsgiref.util import setup_testing_defaults
+
+start = time.perf_counter()
+""" + USE_DATABASE + """
+from deconest_backend.wsgi import application
+booted = time.perf_counter()
+
+environ = {'PATH_INFO': sys.argv[1], 'SERVER_NAME': 'localhost', 'HTTP_HOST': 'localhost'}
+setup_testing_defaults(environ)
+statuses = []
+b''.join(application(environ, lambda status, headers, exc_info=None: statuses.append(status)))
+done = time.perf_counter()
+
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({
+    'import_ms': (booted - start) * 1000,
+    'first_response_ms': (done - booted) * 1000,
+    'status': statuses[0],
+    'rss_mb': rss / (1024 * 1024 if sys.platform == 'darwin' else 1024),
+}))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure worker cold start: WSGI import time, time to first response and peak RSS. "
+        "Runs against a freshly migrated temporary SQLite database, so it needs no local data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--settings-module', action='append', dest='settings_modules',
+            help="Settings module to benchmark (repeatable). Defaults to the full and api-only profiles."
+        )
+        parser.add_argument('--path', default='/api/products/', help="URL requested as the first response.")
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--json', action='store_true', help="Print results as JSON for CI to record.")
+        parser.add_argument('--max-startup-ms', type=float, help="Fail if median process start to first response exceeds this.")
+        parser.add_argument('--max-rss-mb', type=float, help="Fail if median peak RSS exceeds this.")
+
+    def _child(self, script, settings_module, *args):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings_module}
+        return subprocess.run(
+            [sys.executable, '-c', script, *args],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True
+        )
+
+    def _migrate(self, settings_module, database):
+        result = self._child(MIGRATE_SCRIPT, settings_module, '', database)
+        if result.returncode != 0:
+            raise CommandError(f"{settings_module} failed to migrate the benchmark database:\n{result.stderr}")
+
+    def _run_once(self, settings_module, path, database):
+        start = time.perf_counter()
+        result = self._child(CHILD_SCRIPT, settings_module, path, database)
+        total_ms = (time.perf_counter() - start) * 1000
+        if result.returncode != 0:
+            raise CommandError(f"{settings_module} failed to start:\n{result.stderr}")
+        sample = json.loads(result.stdout.strip().splitlines()[-1])
+        if sample['status'].startswith('5'):
+            raise CommandError(f"{settings_module} answered {sample['status']} for {path}:\n{result.stderr}")
+        sample['process_ms'] = total_ms
+        return sample
+
+    def handle(self, *args, **options):
+        modules = options['settings_modules'] or ['deconest_backend.settings', 'deconest_backend.settings_api']
+        results = {}
+        with tempfile.TemporaryDirectory() as directory:
+            database = os.path.join(directory, 'bench.sqlite3')
+            for module in modules:
+                self._migrate(module, database)
+            for module in modules:
+                samples = [self._run_once(module, options['path'], database) for _ in range(options['runs'])]
+                results[module] = self._summarise(samples)
+        self._report(results, options)
+
+    def _summarise(self, samples):
+        result = {
+            key: round(statistics.median(sample[key] for sample in samples), 1)
+            for key in ('import_ms', 'first_response_ms', 'process_ms', 'rss_mb')
+        }
+        result['status'] = samples[-1]['status']
+        return result
+
+    def _report(self, results, options):
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            for module, result in results.items():
+                self.stdout.write(
+                    f"{module}: import {result['import_ms']} ms, first response {result['first_response_ms']} ms "
+                    f"({result['status']}), process {result['process_ms']} ms, RSS {result['rss_mb']} MB"
+                )
+
+        failures = []
+        for module, result in results.items():
+            if options['max_startup_ms'] is not None and result['process_ms'] > options['max_startup_ms']:
+                failures.append(f"{module}: startup {result['process_ms']} ms > {options['max_startup_ms']} ms")
+            if options['max_rss_mb'] is not None and result['rss_mb'] > options['max_rss_mb']:
+                failures.append(f"{module}: RSS {result['rss_mb']} MB > {options['max_rss_mb']} MB")
+        if failures:
+            raise CommandError("Startup budget exceeded:\n" + "\n".join(failures))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api.recommendations import build_recommendations
+
+
+class Command(BaseCommand):
+    help = "Refresh precomputed 'bought together' / 'also wishlisted' recommendations. Needs numpy and scipy."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Rebuild every product instead of only new activity.")
+
+    def handle(self, *args, **options):
+        updated = build_recommendations(full=options['full'])
+        for kind, count in updated.items():
+            self.stdout.write(self.style.SUCCESS(f"{kind}: updated {count} products"))
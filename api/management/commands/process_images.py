@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.images import claim_image, claimable_images, process_image
+from api.models import ImageAsset
+
+
+class Command(BaseCommand):
+    help = "Background worker that downloads pending product images and builds their variants."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Process the current queue and exit.")
+        parser.add_argument('--interval', type=float, default=5, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--batch-size', type=int, default=20)
+
+    def handle(self, *args, **options):
+        while True:
+            candidates = list(claimable_images().order_by('id').values_list('id', flat=True)[:options['batch_size']])
+            # Several workers can see the same candidates; only the one whose claim succeeds processes it.
+            for asset_id in candidates:
+                if not claim_image(asset_id):
+                    continue
+                asset = process_image(ImageAsset.objects.get(pk=asset_id))
+                self.stdout.write(f"{asset.status}: {asset.source_url}")
+            if not candidates:
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
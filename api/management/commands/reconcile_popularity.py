@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.popularity import reconcile_popularity
+
+
+class Command(BaseCommand):
+    help = "Recompute Product.wishlist_count and Product.units_sold from wishlists and orders."
+
+    def handle(self, *args, **options):
+        updated = reconcile_popularity()
+        self.stdout.write(self.style.SUCCESS(f"Reconciled popularity counters for {updated} products"))
@@ -0,0 +1,30 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = "Copy the primary SQLite database into the local replica stand-in(s)."
+
+    def handle(self, *args, **options):
+        primary = connections['default'].settings_dict
+        if primary['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError("sync_replica only works with SQLite; use real replication for other backends.")
+
+        source = sqlite3.connect(primary['NAME'])
+        try:
+            for alias in settings.DATABASE_REPLICAS or ['replica']:
+                replica = connections[alias].settings_dict
+                if replica['ENGINE'] != 'django.db.backends.sqlite3':
+                    raise CommandError(f"Replica '{alias}' is not a SQLite database.")
+                connections[alias].close()
+                target = sqlite3.connect(replica['NAME'])
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(self.style.SUCCESS(f"Copied {primary['NAME']} -> {replica['NAME']}"))
+        finally:
+            source.close()
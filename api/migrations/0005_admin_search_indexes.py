@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_alter_order_total'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='date',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('Pending', 'Pending'), ('Shipped', 'Shipped'), ('Delivered', 'Delivered')], db_index=True, default='Pending', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='title',
+            field=models.CharField(db_index=True, max_length=200),
+        ),
+    ]
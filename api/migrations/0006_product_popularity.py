@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:56
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Product = apps.get_model('api', 'Product')
+    Wishlist = apps.get_model('api', 'Wishlist')
+    OrderItem = apps.get_model('api', 'OrderItem')
+    wishlisted = Wishlist.objects.filter(product=OuterRef('pk')).values('product').annotate(total=Count('pk')).values('total')
+    sold = OrderItem.objects.filter(product=OuterRef('pk')).values('product').annotate(total=Sum('quantity')).values('total')
+    Product.objects.update(
+        wishlist_count=Coalesce(Subquery(wishlisted), 0, output_field=models.IntegerField()),
+        units_sold=Coalesce(Subquery(sold), 0, output_field=models.IntegerField()),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_admin_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='units_sold',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='wishlist_count',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
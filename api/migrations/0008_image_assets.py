@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def queue_existing_images(apps, schema_editor):
+    ImageAsset = apps.get_model('api', 'ImageAsset')
+    Product = apps.get_model('api', 'Product')
+    for url in Product.objects.exclude(image='').values_list('image', flat=True).distinct():
+        asset, _ = ImageAsset.objects.get_or_create(source_url=url)
+        Product.objects.filter(image=url).update(image_asset=asset)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_order_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageAsset',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_url', models.URLField(max_length=500, unique=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], db_index=True, default='pending', max_length=10)),
+                ('content_hash', models.CharField(blank=True, max_length=64)),
+                ('original', models.CharField(blank=True, max_length=255)),
+                ('variants', models.JSONField(blank=True, default=dict)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_asset',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.imageasset'),
+        ),
+        migrations.RunPython(queue_existing_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_request_profile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=10, unique=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProductRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('bought', 'Frequently bought together'), ('wishlisted', 'Also wishlisted')], max_length=10)),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='api.product')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'kind', 'rank'], name='api_product_product_476dea_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations
+
+
+# Columns searched with the admin's case-insensitive prefix (^) and exact (=) lookups.
+SEARCH_COLUMNS = [
+    ('api_user', 'username'),
+    ('api_user', 'email'),
+    ('api_profile', 'phone'),
+    ('api_product', 'title'),
+    ('api_product', 'room'),
+]
+
+
+def _index_name(table, column):
+    return f"{table}_{column}_ci_like"
+
+
+def create_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table, column in SEARCH_COLUMNS:
+        if vendor == 'postgresql':
+            # Matches Django's istartswith/iexact SQL: UPPER("col"::text) LIKE UPPER(%s)
+            expression = f'UPPER("{column}"::text) text_pattern_ops'
+        elif vendor == 'sqlite':
+            # SQLite's LIKE is case-insensitive and can use a NOCASE index for prefixes.
+            expression = f'"{column}" COLLATE NOCASE'
+        else:
+            continue
+        schema_editor.execute(f'CREATE INDEX "{_index_name(table, column)}" ON "{table}" ({expression})')
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor not in ('postgresql', 'sqlite'):
+        return
+    for table, column in SEARCH_COLUMNS:
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{_index_name(table, column)}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_shared_cache_table'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
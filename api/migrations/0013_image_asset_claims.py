@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_admin_prefix_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageasset',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='imageasset',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], db_index=True, default='pending', max_length=10),
+        ),
+    ]
@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+def reset_bought_watermark(apps, schema_editor):
+    # The 'bought' watermark used to hold an Order id and now holds an OrderItem id,
+    # so start it over; the next incremental run then covers every ordered product.
+    apps.get_model('api', 'RecommendationWatermark').objects.filter(kind='bought').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_image_asset_claims'),
+    ]
+
+    operations = [
+        migrations.RunPython(reset_bought_watermark, migrations.RunPython.noop),
+    ]
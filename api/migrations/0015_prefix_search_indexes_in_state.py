@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:25
+
+from importlib import import_module
+
+import api.models
+from django.db import migrations, models
+
+
+# 0012 created these with raw SQL, outside migration state, so a table rebuild
+# could drop them silently. They are replaced by the PrefixSearchIndex entries below.
+raw_indexes = import_module('api.migrations.0012_admin_prefix_search_indexes')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_reset_bought_watermark'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunPython(raw_indexes.drop_indexes, raw_indexes.create_indexes),
+        migrations.AlterField(
+            model_name='product',
+            name='title',
+            field=models.CharField(max_length=200),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=api.models.PrefixSearchIndex(fields=['title'], name='api_product_title_ci'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=api.models.PrefixSearchIndex(fields=['room'], name='api_product_room_ci'),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=api.models.PrefixSearchIndex(fields=['phone'], name='api_profile_phone_ci'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=api.models.PrefixSearchIndex(fields=['username'], name='api_user_username_ci'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=api.models.PrefixSearchIndex(fields=['email'], name='api_user_email_ci'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_prefix_search_indexes_in_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageasset',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='imageasset',
+            name='retry_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,7 +1,32 @@
 from django.db import models
+from django.db.models import F, TextField
+from django.db.models.functions import Cast, Collate, Upper
 from django.contrib.auth.models import AbstractUser
 
 
+class PrefixSearchIndex(models.Index):
+    """
+    Index for the admin's case-insensitive prefix search (`^field`) on one field.
+
+    Django runs that lookup as UPPER("col"::text) LIKE on PostgreSQL and as a
+    plain LIKE on SQLite, and neither can use an ordinary b-tree index. This
+    creates an index matching each backend's SQL instead.
+    """
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        field = self.fields[0]
+        vendor = schema_editor.connection.vendor
+        if vendor == 'postgresql':
+            from django.contrib.postgres.indexes import OpClass
+
+            expression = OpClass(Upper(Cast(field, TextField())), name='text_pattern_ops')
+        elif vendor == 'sqlite':
+            expression = Collate(F(field), 'NOCASE')
+        else:
+            return super().create_sql(model, schema_editor, using=using, **kwargs)
+        return models.Index(expression, name=self.name).create_sql(model, schema_editor, using=using, **kwargs)
+
+
 class User(AbstractUser):
     ROLE_CHOICES = (
         ('admin', 'Admin'),
@@ -11,6 +36,12 @@ class User(AbstractUser):
     is_blocked = models.BooleanField(default=False) 
     email=models.EmailField(max_length=50,unique=True)
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            PrefixSearchIndex(fields=['username'], name='api_user_username_ci'),
+            PrefixSearchIndex(fields=['email'], name='api_user_email_ci'),
+        ]
+
     def __str__(self):
         return self.username
 
@@ -25,6 +56,9 @@ class Profile(models.Model):
     phone = models.CharField(max_length=20, blank=True, null=True)
     address = models.TextField(blank=True, null=True)
 
+    class Meta:
+        indexes = [PrefixSearchIndex(fields=['phone'], name='api_profile_phone_ci')]
+
     def __str__(self):
         return f"{self.user.username}'s profile"
 
@@ -32,15 +66,56 @@ class Profile(models.Model):
 
 
 
+class ImageAsset(models.Model):
+    """A remote image copied into our storage, with resized variants built by process_images."""
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    )
+
+    source_url = models.URLField(max_length=500, unique=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', db_index=True)
+    content_hash = models.CharField(max_length=64, blank=True)
+    original = models.CharField(max_length=255, blank=True)
+    # {format: {width: storage path}}
+    variants = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+    # Set when a process_images worker takes the asset; stale claims are retried.
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    # Failed fetches due to network or server errors; the asset waits until retry_at before the next try.
+    attempts = models.PositiveSmallIntegerField(default=0)
+    retry_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.source_url
+
+
+
+
+
 class Product(models.Model):
     title = models.CharField(max_length=200)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     room = models.CharField(max_length=100)
     image = models.URLField()
+    image_asset = models.ForeignKey(ImageAsset, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
     stock = models.PositiveIntegerField(default=0)
     is_archived = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Popularity counters, updated with F() on wishlist changes and checkout
+    # and corrected by the reconcile_popularity command.
+    wishlist_count = models.PositiveIntegerField(default=0, db_index=True)
+    units_sold = models.PositiveIntegerField(default=0, db_index=True)
+
+    class Meta:
+        indexes = [
+            PrefixSearchIndex(fields=['title'], name='api_product_title_ci'),
+            PrefixSearchIndex(fields=['room'], name='api_product_room_ci'),
+        ]
 
     def __str__(self):
         return self.title
@@ -86,8 +161,8 @@ class Order(models.Model):
     total = models.DecimalField(max_digits=10, decimal_places=2, default=0)  # default 0
     address = models.CharField(max_length=255)
     payment_method = models.CharField(max_length=20, default='cod')
-    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')
-    date = models.DateTimeField(auto_now_add=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending', db_index=True)
+    date = models.DateTimeField(auto_now_add=True, db_index=True)
 
     def save(self, *args, **kwargs):
         
@@ -109,3 +184,83 @@ class OrderItem(models.Model):
 
     def __str__(self):
         return f"{self.product.title} x {self.quantity}"
+
+
+class ArchivedOrder(models.Model):
+    """Delivered order moved out of the live tables by the archive_orders command."""
+    id = models.BigIntegerField(primary_key=True)  # keeps the original Order id
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_orders')
+    total = models.DecimalField(max_digits=10, decimal_places=2)
+    address = models.CharField(max_length=255)
+    payment_method = models.CharField(max_length=20)
+    status = models.CharField(max_length=20)
+    date = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['user', '-date'])]
+
+    def __str__(self):
+        return f"Archived order #{self.id} - {self.user.username}"
+
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)  # keeps the original OrderItem id
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='items')
+    # No constraint or cascade: deleting a product must not touch archived history,
+    # so the title and price are copied at archive time.
+    product = models.ForeignKey(Product, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    title = models.CharField(max_length=200)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    quantity = models.PositiveIntegerField(default=1)
+
+    def subtotal(self):
+        return self.price * self.quantity
+
+    def __str__(self):
+        return f"{self.title} x {self.quantity}"
+
+
+class RequestProfile(models.Model):
+    """One profiled request captured by api.profiling.ProfilingMiddleware."""
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    samples = models.PositiveIntegerField(default=0)
+    # Folded stacks ("frame;frame;frame count" per line), readable by flamegraph.pl and speedscope
+    stacks = models.TextField(blank=True)
+    # [{"sql", "ms", "origin", "stack"}]; origin is the innermost frame of stack
+    queries = models.JSONField(default=list, blank=True)
+    query_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
+
+
+class ProductRecommendation(models.Model):
+    """Precomputed top-K neighbours of a product, written by build_recommendations."""
+    KIND_CHOICES = (
+        ('bought', 'Frequently bought together'),
+        ('wishlisted', 'Also wishlisted'),
+    )
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommendations')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=['product', 'kind', 'rank'])]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} ({self.kind} #{self.rank})"
+
+
+class RecommendationWatermark(models.Model):
+    """Highest source row id (order item or wishlist) already folded into the recommendations."""
+    kind = models.CharField(max_length=10, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
@@ -0,0 +1,45 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .models import Product, Wishlist, OrderItem, ArchivedOrderItem
+
+
+def record_wishlist_add(product_id):
+    Product.objects.filter(pk=product_id).update(wishlist_count=F('wishlist_count') + 1)
+
+
+def record_wishlist_remove(product_id):
+    Product.objects.filter(pk=product_id, wishlist_count__gt=0).update(wishlist_count=F('wishlist_count') - 1)
+
+
+def record_units_sold(product_id, quantity):
+    Product.objects.filter(pk=product_id).update(units_sold=F('units_sold') + quantity)
+
+
+def reconcile_popularity():
+    """Recompute every product's counters from wishlists and live plus archived order items."""
+    wishlisted = (
+        Wishlist.objects.filter(product=OuterRef('pk'))
+        .values('product')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    sold = (
+        OrderItem.objects.filter(product=OuterRef('pk'))
+        .values('product')
+        .annotate(total=Sum('quantity'))
+        .values('total')
+    )
+    archived_sold = (
+        ArchivedOrderItem.objects.filter(product=OuterRef('pk'))
+        .values('product')
+        .annotate(total=Sum('quantity'))
+        .values('total')
+    )
+    return Product.objects.update(
+        wishlist_count=Coalesce(Subquery(wishlisted), 0, output_field=IntegerField()),
+        units_sold=(
+            Coalesce(Subquery(sold), 0, output_field=IntegerField())
+            + Coalesce(Subquery(archived_sold), 0, output_field=IntegerField())
+        ),
+    )
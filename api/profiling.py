@@ -0,0 +1,223 @@
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.db import connections
+
+from .models import RequestProfile
+
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+TOKEN_SALT = 'api.profiling'
+
+# Only one request is profiled at a time per process, which bounds the overhead under load.
+_active = threading.Lock()
+
+
+def make_profiling_token():
+    """Signed value for the X-Profile header; valid for PROFILING_TOKEN_MAX_AGE seconds."""
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign('profile')
+
+
+def _valid_token(value):
+    try:
+        signing.TimestampSigner(salt=TOKEN_SALT).unsign(value, max_age=settings.PROFILING_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def _frame_name(code):
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({code.co_filename}:{code.co_firstlineno})"
+
+
+class StackSampler(threading.Thread):
+    """Samples another thread's stack every `interval` seconds and counts folded stacks."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            if names:
+                self.counts[';'.join(reversed(names))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def folded(self):
+        stacks = self.counts.most_common(settings.PROFILING_MAX_STACKS)
+        return '\n'.join(f"{stack} {count}" for stack, count in stacks)
+
+
+# Frames that only pass the call through, so they'd show up as the origin of every query.
+WRAPPER_FRAMES = {
+    ('api/routers.py', 'dispatch'),
+}
+
+
+def _query_stack():
+    """
+    Innermost PROFILING_QUERY_FRAMES frames from our code and DRF above the
+    query, e.g. ['rest_framework/serializers.py:703 in to_representation', ...].
+    Django internals and known wrappers are left out.
+    """
+    base_dir = str(settings.BASE_DIR) + '/'
+    stack = []
+    frame = sys._getframe(2)
+    while frame is not None and len(stack) < settings.PROFILING_QUERY_FRAMES:
+        filename = frame.f_code.co_filename
+        if '/rest_framework/' in filename:
+            location = 'rest_framework/' + filename.rsplit('/rest_framework/', 1)[1]
+        elif filename.startswith(base_dir) and 'site-packages' not in filename and filename != __file__:
+            location = filename[len(base_dir):]
+        else:
+            location = None
+        if location and (location, frame.f_code.co_name) not in WRAPPER_FRAMES:
+            stack.append(f"{location}:{frame.f_lineno} in {frame.f_code.co_name}")
+        frame = frame.f_back
+    return stack
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.queries = []
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            if len(self.queries) < settings.PROFILING_MAX_QUERIES:
+                ms = round((time.perf_counter() - start) * 1000, 3)
+                stack = _query_stack()
+                self.queries.append({
+                    'sql': sql,
+                    'ms': ms,
+                    'origin': stack[0] if stack else None,
+                    'stack': stack,
+                })
+
+
+class ProfilingMiddleware:
+    """
+    Profile a PROFILING_SAMPLE_RATE fraction of requests, plus any request
+    carrying a valid signed X-Profile header. Results are stored as
+    RequestProfile rows, capped at PROFILING_MAX_RECORDS, and can be
+    downloaded from the admin.
+
+    Under ASGI the sampler has to follow the thread that runs the view, so
+    process_view runs sync views there itself and only the view is measured.
+    Async views (the event stream) are not profiled; a request that asked for
+    profiling with X-Profile gets an X-Profile-Skipped header instead.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _should_profile(self, request):
+        token = request.META.get(PROFILE_HEADER)
+        if token:
+            return _valid_token(token)
+        return random.random() < settings.PROFILING_SAMPLE_RATE
+
+    def _claim(self, request):
+        return settings.PROFILING_ENABLED and self._should_profile(request) and _active.acquire(blocking=False)
+
+    def _skipped(self, request, response, reason):
+        if request.META.get(PROFILE_HEADER):
+            response['X-Profile-Skipped'] = reason
+        return response
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self._claim(request):
+            return self._skipped(request, self.get_response(request), 'busy or invalid token')
+        try:
+            response, measured = self._measure(self.get_response, request)
+        finally:
+            _active.release()
+        return self._save(request, response, *measured)
+
+    async def __acall__(self, request):
+        if not self._claim(request):
+            return self._skipped(request, await self.get_response(request), 'busy or invalid token')
+        request._profile = {}
+        try:
+            response = await self.get_response(request)
+        finally:
+            _active.release()
+        if 'measured' not in request._profile:
+            return self._skipped(request, response, request._profile.get('skipped', 'no view ran'))
+        return await sync_to_async(self._save)(request, response, *request._profile['measured'])
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Only set by __acall__. Django runs this in the same worker thread as a sync view.
+        state = getattr(request, '_profile', None)
+        if state is None:
+            return None
+        if iscoroutinefunction(view_func):
+            state['skipped'] = 'async view'
+            return None
+        response, state['measured'] = self._measure(view_func, request, *view_args, **view_kwargs)
+        return response
+
+    def _measure(self, func, *args, **kwargs):
+        sampler = StackSampler(threading.get_ident(), settings.PROFILING_INTERVAL)
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(recorder))
+                response = func(*args, **kwargs)
+        finally:
+            sampler.stop()
+        return response, (sampler, recorder, (time.perf_counter() - start) * 1000)
+
+    def _save(self, request, response, sampler, recorder, duration_ms):
+        record = RequestProfile.objects.create(
+            method=request.method,
+            path=request.path[:500],
+            status_code=response.status_code,
+            duration_ms=duration_ms,
+            samples=sum(sampler.counts.values()),
+            stacks=sampler.folded(),
+            queries=recorder.queries,
+            query_count=recorder.count,
+        )
+        self._trim()
+        response['X-Profile-Id'] = str(record.pk)
+        return response
+
+    def _trim(self):
+        limit = settings.PROFILING_MAX_RECORDS
+        oldest_kept = list(RequestProfile.objects.order_by('-id').values_list('id', flat=True)[limit - 1:limit])
+        if oldest_kept:
+            RequestProfile.objects.filter(id__lt=oldest_kept[0]).delete()
@@ -0,0 +1,168 @@
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count, Max
+
+from .models import (
+    Product, OrderItem, ArchivedOrderItem, Wishlist, ProductRecommendation, RecommendationWatermark,
+)
+
+
+def recommendations_cache_key(product_id):
+    return f"products:{product_id}:recommendations"
+
+
+def _order_baskets(products=None):
+    """
+    (order id, product id) pairs from live and archived orders, for products that still exist.
+    With `products`, only orders containing at least one of them are loaded.
+    """
+    existing = Product.objects.values('id')
+    pairs = []
+    for model in (OrderItem, ArchivedOrderItem):
+        items = model.objects.filter(product_id__in=existing)
+        if products is not None:
+            items = items.filter(order_id__in=model.objects.filter(product_id__in=products).values('order_id'))
+        pairs.extend(items.values_list('order_id', 'product_id'))
+    return pairs
+
+
+def _order_counts(products):
+    """Number of orders each product appears in. Archived orders keep their ids, so the two sets are disjoint."""
+    counts = Counter()
+    for model in (OrderItem, ArchivedOrderItem):
+        rows = model.objects.filter(product_id__in=products).values('product_id').annotate(n=Count('order_id', distinct=True))
+        counts.update({row['product_id']: row['n'] for row in rows})
+    return counts
+
+
+def _wishlist_baskets(products=None):
+    rows = Wishlist.objects.all()
+    if products is not None:
+        rows = rows.filter(user_id__in=Wishlist.objects.filter(product_id__in=products).values('user_id'))
+    return list(rows.values_list('user_id', 'product_id'))
+
+
+def _wishlist_counts(products):
+    rows = Wishlist.objects.filter(product_id__in=products).values('product_id').annotate(n=Count('user_id', distinct=True))
+    return {row['product_id']: row['n'] for row in rows}
+
+
+def _newest_order_item():
+    # Archived items keep their ids, so the newest id doesn't drop when the newest orders are archived.
+    return max(model.objects.aggregate(latest=Max('id'))['latest'] or 0 for model in (OrderItem, ArchivedOrderItem))
+
+
+# kind -> (basket pairs, baskets per product, newest source id, products touched by sources newer than an id).
+# 'bought' follows order item ids: items are created in the same transaction as their order.
+SOURCES = {
+    'bought': (
+        _order_baskets,
+        _order_counts,
+        _newest_order_item,
+        lambda since, until: OrderItem.objects.filter(id__gt=since, id__lte=until).values_list('product_id', flat=True),
+    ),
+    'wishlisted': (
+        _wishlist_baskets,
+        _wishlist_counts,
+        lambda: Wishlist.objects.aggregate(latest=Max('id'))['latest'] or 0,
+        lambda since, until: Wishlist.objects.filter(id__gt=since, id__lte=until).values_list('product_id', flat=True),
+    ),
+}
+
+
+def top_neighbours(pairs, top_k, products=None, counts=None):
+    """
+    Cosine-normalised co-occurrence neighbours from (basket, product) pairs.
+
+    Builds a sparse basket x product matrix B and computes rows of B.T @ B.
+    Only the rows for `products` are computed when given (all otherwise).
+    `counts` ({product id: baskets}) overrides the per-product basket counts
+    taken from `pairs`, for when `pairs` only holds the baskets of `products`.
+    Returns {product id: [(related id, score), ...]} with at most `top_k` entries each.
+    """
+    import numpy as np
+    from scipy import sparse
+
+    if not pairs:
+        return {}
+    data = np.array(pairs, dtype=np.int64)
+    basket_ids, basket_codes = np.unique(data[:, 0], return_inverse=True)
+    product_ids, product_codes = np.unique(data[:, 1], return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(data)), (basket_codes, product_codes)),
+        shape=(len(basket_ids), len(product_ids)),
+    )
+    matrix.data[:] = 1  # a product listed twice in one basket still counts once
+    if counts is None:
+        counts = np.asarray(matrix.sum(axis=0)).ravel()
+    else:
+        counts = np.array([counts[pk] for pk in product_ids], dtype=np.float64)
+
+    if products is None:
+        columns = np.arange(len(product_ids))
+    else:
+        columns = np.flatnonzero(np.isin(product_ids, list(products)))
+    co_occurrence = (matrix[:, columns].T @ matrix).tocsr()
+
+    neighbours = {}
+    for row, column in enumerate(columns):
+        start, end = co_occurrence.indptr[row], co_occurrence.indptr[row + 1]
+        related = co_occurrence.indices[start:end]
+        together = co_occurrence.data[start:end]
+        keep = related != column
+        related, together = related[keep], together[keep]
+        scores = together / np.sqrt(counts[column] * counts[related])
+        top = np.argsort(-scores, kind='stable')[:top_k]
+        neighbours[int(product_ids[column])] = [(int(product_ids[related[i]]), float(scores[i])) for i in top]
+    return neighbours
+
+
+def _store(kind, neighbours, full):
+    with transaction.atomic():
+        stale = ProductRecommendation.objects.filter(kind=kind)
+        if not full:
+            stale = stale.filter(product_id__in=list(neighbours))
+        stale_products = set(stale.values_list('product_id', flat=True))
+        stale.delete()
+        ProductRecommendation.objects.bulk_create([
+            ProductRecommendation(product_id=product_id, related_id=related_id, kind=kind, score=score, rank=rank)
+            for product_id, related in neighbours.items()
+            for rank, (related_id, score) in enumerate(related, start=1)
+        ], batch_size=1000)
+    caches['shared'].delete_many([recommendations_cache_key(pk) for pk in stale_products | set(neighbours)])
+
+
+def build_recommendations(full=False):
+    """
+    Refresh the ProductRecommendation table.
+
+    Incremental runs recompute the products in order items or wishlist rows
+    added since the last run, plus every product sharing a basket with them,
+    since those scores depend on the touched products' counts. Only the
+    baskets containing one of these products are loaded. Removals are picked
+    up by a full run, which should be scheduled periodically.
+    Returns {kind: number of products updated}.
+    """
+    updated = {}
+    for kind, (baskets, basket_counts, newest_id, touched_since) in SOURCES.items():
+        watermark, _ = RecommendationWatermark.objects.get_or_create(kind=kind)
+        latest = newest_id()
+        if full:
+            neighbours = top_neighbours(baskets(), settings.RECOMMENDATIONS_TOP_K)
+        else:
+            if latest <= watermark.last_id:
+                updated[kind] = 0
+                continue
+            touched = set(touched_since(watermark.last_id, latest))
+            affected = touched | {product_id for _, product_id in baskets(touched)}
+            pairs = baskets(affected)
+            counts = basket_counts({product_id for _, product_id in pairs})
+            neighbours = top_neighbours(pairs, settings.RECOMMENDATIONS_TOP_K, affected, counts)
+        _store(kind, neighbours, full)
+        watermark.last_id = latest
+        watermark.save()
+        updated[kind] = len(neighbours)
+    return updated
@@ -0,0 +1,92 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from rest_framework import status
+
+
+_read_from_replica = ContextVar('read_from_replica', default=False)
+
+STICKY_COOKIE = 'replica_sticky'
+STICKY_SALT = 'api.routers.sticky'
+
+
+def mark_recent_write(request, response):
+    """
+    Keep this user's reads on the primary for REPLICA_STICKY_SECONDS.
+
+    Carried in a signed cookie rather than a cache entry, so checking it
+    costs no query on the primary for every replica read.
+    """
+    response.set_signed_cookie(
+        STICKY_COOKIE, str(request.user.pk), salt=STICKY_SALT,
+        max_age=settings.REPLICA_STICKY_SECONDS, httponly=True, samesite='Lax',
+    )
+
+
+def has_recent_write(request):
+    value = request.get_signed_cookie(
+        STICKY_COOKIE, default=None, salt=STICKY_SALT, max_age=settings.REPLICA_STICKY_SECONDS,
+    )
+    return value is not None and value == str(request.user.pk)
+
+
+class PrimaryReplicaRouter:
+    """
+    Send reads to a replica only while a view has opted in for the current
+    request (see ReplicaReadMixin). Everything else, including all writes,
+    stays on the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        # Only our own tables; the shared cache table must always be read from the primary.
+        if replicas and _read_from_replica.get() and model._meta.app_label == 'api':
+            return random.choice(replicas)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaReadMixin:
+    """
+    Serve `replica_actions` from a read replica.
+
+    Users who wrote through one of these views in the last few seconds are
+    kept on the primary so they always see their own changes. That relies on
+    the client sending cookies back; one that doesn't may briefly read data
+    older than its own writes.
+    """
+    replica_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        user = request.user
+        if self.action in self.replica_actions and not (user.is_authenticated and has_recent_write(request)):
+            self._replica_token = _read_from_replica.set(True)
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            # Also reached when an unhandled exception skips finalize_response,
+            # so a failed request can't leave the worker thread on the replica.
+            token = getattr(self, '_replica_token', None)
+            if token is not None:
+                _read_from_replica.reset(token)
+                self._replica_token = None
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if (request.method not in ('GET', 'HEAD', 'OPTIONS')
+                and status.is_success(response.status_code)
+                and request.user.is_authenticated):
+            mark_recent_write(request, response)
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import User, Product, Wishlist, CartItem, Order, OrderItem
+from .models import User, Product, Wishlist, CartItem, Order, OrderItem, ArchivedOrder, ArchivedOrderItem
 
 
 
@@ -52,9 +52,17 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 class ProductSerializer(TimestampSerializerMixin):
+    images = serializers.SerializerMethodField()
+
     class Meta:
         model = Product
         fields = '__all__'
+        read_only_fields = ['wishlist_count', 'units_sold', 'image_asset']
+
+    def get_images(self, obj):
+        from .images import image_srcset
+
+        return image_srcset(obj.image_asset)
 
 
 
@@ -119,3 +127,38 @@ class OrderSerializer(UserReferenceMixin, serializers.ModelSerializer):
         fields = ['id', 'user', 'total', 'address', 'payment_method', 'status', 'date', 'items']
         read_only_fields = ['user', 'status', 'date', 'total']
 
+
+class ArchivedOrderItemSerializer(serializers.ModelSerializer):
+    product = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ArchivedOrderItem
+        fields = ['id', 'product', 'quantity']
+
+    def get_product(self, obj):
+        try:
+            product = obj.product
+        except Product.DoesNotExist:
+            product = None
+        if product is None:
+            # Deleted since archiving: only the copied id, title and price are left.
+            return {'id': obj.product_id, 'title': obj.title, 'price': str(obj.price)}
+        return ProductSerializer(product, context=self.context).data
+
+
+class ArchivedOrderSerializer(serializers.ModelSerializer):
+    """
+    Same shape as OrderSerializer plus an `archived` flag. The one difference:
+    if an item's product has been deleted, `product` is only
+    {id, title, price} from the time of archiving.
+    """
+    items = ArchivedOrderItemSerializer(many=True, read_only=True)
+    archived = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ArchivedOrder
+        fields = ['id', 'user', 'total', 'address', 'payment_method', 'status', 'date', 'items', 'archived']
+        read_only_fields = fields
+
+    def get_archived(self, obj):
+        return True
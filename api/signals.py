@@ -1,9 +1,64 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_init, post_save
 from django.dispatch import receiver
-from .models import User, Profile
+from .models import User, Profile, Product, Order
+
+# events and images are imported inside the handlers: workers load this module
+# at startup, and api.images pulls in urllib.request, ssl and email.
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
         Profile.objects.create(user=instance)
         print(f"Profile created for new user: {instance.username}")
+
+
+@receiver(post_save, sender=Product)
+def queue_product_image(sender, instance, **kwargs):
+    # Compared with the URL loaded from the database, so ordinary saves don't fetch the asset.
+    if not instance.image:
+        return
+    if instance.image_asset_id is None or instance.image != instance._queued_image:
+        from .images import enqueue_image
+
+        instance.image_asset = enqueue_image(instance.image)
+        Product.objects.filter(pk=instance.pk).update(image_asset=instance.image_asset)
+    instance._queued_image = instance.image
+
+
+# Remember the loaded values so post_save only publishes real changes.
+# __dict__ is used so deferred fields are not fetched.
+@receiver(post_init, sender=Order)
+def remember_order_status(sender, instance, **kwargs):
+    instance._published_status = instance.__dict__.get('status')
+
+
+@receiver(post_init, sender=Product)
+def remember_product_state(sender, instance, **kwargs):
+    instance._published_stock = instance.__dict__.get('stock')
+    instance._queued_image = instance.__dict__.get('image')
+
+
+@receiver(post_save, sender=Order)
+def publish_order_status(sender, instance, created, **kwargs):
+    if not created and instance.status != instance._published_status:
+        from .events import order_channel, publish_on_commit
+
+        publish_on_commit(order_channel(instance.pk), {
+            'type': 'order.status',
+            'id': instance.pk,
+            'status': instance.status,
+        })
+    instance._published_status = instance.status
+
+
+@receiver(post_save, sender=Product)
+def publish_product_stock(sender, instance, created, **kwargs):
+    if not created and instance.stock != instance._published_stock:
+        from .events import product_channel, publish_on_commit
+
+        publish_on_commit(product_channel(instance.pk), {
+            'type': 'product.stock',
+            'id': instance.pk,
+            'stock': instance.stock,
+        })
+    instance._published_stock = instance.stock
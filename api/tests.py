@@ -1,3 +1,566 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+from urllib.error import HTTPError, URLError
 
-# Create your tests here.
+from django.test import AsyncClient, Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.contrib.admin.sites import site
+from django.core.cache import caches
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .images import _variant_widths, claim_image, process_image
+from .events import InProcessBroker, make_events_token
+from .idempotency import _cache_key
+from .recommendations import build_recommendations, top_neighbours
+from .profiling import PROFILE_HEADER, ProfilingMiddleware, make_profiling_token
+from .models import (
+    User, Product, Wishlist, CartItem, Order, OrderItem, ArchivedOrder, ArchivedOrderItem, ImageAsset,
+    RequestProfile, ProductRecommendation,
+)
+from .routers import STICKY_COOKIE, PrimaryReplicaRouter, _read_from_replica
+from .views import ProductViewSet, get_tokens_for_user
+
+
+def make_product(title='Lamp', price='10.00', stock=5):
+    return Product.objects.create(title=title, description='', price=price, room='Living', image='', stock=stock)
+
+
+class ImageTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+
+    @override_settings(IMAGE_VARIANT_WIDTHS=[320, 640, 1280])
+    def test_variant_widths_never_upscale(self):
+        self.assertEqual(_variant_widths(2000), [320, 640, 1280])
+        self.assertEqual(_variant_widths(500), [320, 500])
+        self.assertEqual(_variant_widths(100), [100])
+
+    def test_process_image_from_local_file(self):
+        from PIL import Image
+
+        source = Path(self.media_root) / 'source.png'
+        Image.new('RGB', (400, 200), 'red').save(source)
+        asset = ImageAsset.objects.create(source_url=source.as_uri())
+
+        with override_settings(MEDIA_ROOT=self.media_root, IMAGE_ALLOW_FILE_URLS=True,
+                               IMAGE_VARIANT_WIDTHS=[320, 640], IMAGE_VARIANT_FORMATS=['webp']):
+            asset = process_image(asset)
+
+        self.assertEqual(asset.status, 'ready', asset.error)
+        self.assertEqual(sorted(asset.variants['webp']), ['320', '400'])
+        with Image.open(Path(self.media_root) / asset.variants['webp']['320']) as variant:
+            self.assertEqual(variant.size, (320, 160))
+
+    def test_file_urls_need_explicit_setting(self):
+        asset = process_image(ImageAsset.objects.create(source_url='file:///etc/hostname'))
+        self.assertEqual(asset.status, 'failed')
+        self.assertIn('scheme', asset.error)
+
+    @override_settings(IMAGE_MAX_ATTEMPTS=2, IMAGE_RETRY_BACKOFF=60)
+    def test_network_errors_are_retried_with_backoff(self):
+        asset = ImageAsset.objects.create(source_url='https://example.com/a.png')
+        error = HTTPError(asset.source_url, 503, 'Service Unavailable', {}, None)
+
+        with mock.patch('api.images.urlopen', side_effect=error):
+            asset = process_image(asset)
+        self.assertEqual((asset.status, asset.attempts), ('pending', 1))
+        self.assertGreater(asset.retry_at, timezone.now() + timedelta(seconds=50))
+        self.assertFalse(claim_image(asset.pk))
+
+        ImageAsset.objects.filter(pk=asset.pk).update(retry_at=timezone.now())
+        self.assertTrue(claim_image(asset.pk))
+        with mock.patch('api.images.urlopen', side_effect=URLError('timed out')):
+            asset = process_image(ImageAsset.objects.get(pk=asset.pk))
+        self.assertEqual((asset.status, asset.attempts), ('failed', 2))
+
+    def test_client_errors_fail_immediately(self):
+        asset = ImageAsset.objects.create(source_url='https://example.com/missing.png')
+        with mock.patch('api.images.urlopen', side_effect=HTTPError(asset.source_url, 404, 'Not Found', {}, None)):
+            asset = process_image(asset)
+        self.assertEqual(asset.status, 'failed')
+
+    def test_product_save_only_enqueues_changed_images(self):
+        product = make_product()
+        Product.objects.filter(pk=product.pk).update(image='https://example.com/a.png')
+        product = Product.objects.get(pk=product.pk)
+        product.save()
+        first_asset = Product.objects.get(pk=product.pk).image_asset_id
+        self.assertIsNotNone(first_asset)
+
+        product = Product.objects.get(pk=product.pk)
+        product.price = '12.00'
+        with self.assertNumQueries(1):
+            product.save()
+
+        product.image = 'https://example.com/b.png'
+        product.save()
+        self.assertNotEqual(Product.objects.get(pk=product.pk).image_asset_id, first_asset)
+
+    def test_claim_is_taken_once(self):
+        asset = ImageAsset.objects.create(source_url='https://example.com/a.png')
+        self.assertTrue(claim_image(asset.pk))
+        self.assertFalse(claim_image(asset.pk))
+        ImageAsset.objects.filter(pk=asset.pk).update(claimed_at=timezone.now() - timedelta(days=1))
+        self.assertTrue(claim_image(asset.pk))
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        CartItem.objects.create(user=self.user, product=make_product(), quantity=1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def checkout(self, address='x', key='k1'):
+        return self.client.post('/api/orders/', {'address': address}, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_response(self):
+        first = self.checkout()
+        retry = self.checkout()
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_key_reuse_with_different_body_is_rejected(self):
+        self.checkout(address='x')
+        response = self.checkout(address='y')
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_retry_while_first_request_runs_conflicts(self):
+        request = SimpleNamespace(user=self.user, path='/api/orders/')
+        caches['shared'].add(f"{_cache_key(request, 'k1')}:lock", 1)
+
+        response = self.checkout()
+
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Order.objects.exists())
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('shopper', 'shopper@example.com', 'pw')
+        self.product = make_product()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def product_reads(self, url='/api/products/'):
+        """Aliases the router picked for Product reads. The query itself still runs on the primary."""
+        chosen = []
+        route = PrimaryReplicaRouter.db_for_read
+
+        def spy(router, model, **hints):
+            alias = route(router, model, **hints)
+            if model is Product:
+                chosen.append(alias)
+            return 'default'
+
+        with mock.patch.object(PrimaryReplicaRouter, 'db_for_read', spy):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return set(chosen)
+
+    def test_list_reads_from_replica(self):
+        self.assertEqual(self.product_reads(), {'replica'})
+        self.assertFalse(_read_from_replica.get())
+
+    def test_write_keeps_user_on_primary(self):
+        response = self.client.post('/api/wishlist/', {'product_id': self.product.pk}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertIn(STICKY_COOKIE, response.cookies)
+
+        self.assertEqual(self.product_reads(), {'default'})
+
+    def test_sticky_cookie_belongs_to_one_user(self):
+        self.client.post('/api/wishlist/', {'product_id': self.product.pk}, format='json')
+        self.client.force_authenticate(User.objects.create_user('other', 'other@example.com', 'pw'))
+
+        self.assertEqual(self.product_reads(), {'replica'})
+
+    def test_sticky_check_runs_no_query(self):
+        self.client.post('/api/wishlist/', {'product_id': self.product.pk}, format='json')
+        with CaptureQueriesContext(connections['default']) as queries:
+            self.client.get(f'/api/products/{self.product.pk}/')
+        self.assertFalse([q for q in queries.captured_queries if 'api_shared_cache' in q['sql']])
+
+    def test_failed_request_does_not_leak_replica_routing(self):
+        with mock.patch.object(ProductViewSet, 'list', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.client.get('/api/products/')
+        self.assertFalse(_read_from_replica.get())
+
+
+class AdminSearchTests(TestCase):
+    def search(self, model, term):
+        queryset, _ = site._registry[model].get_search_results(RequestFactory().get('/'), model.objects.all(), term)
+        return queryset
+
+    def test_prefix_search_is_case_insensitive(self):
+        lamp = make_product(title='Lamp')
+        make_product(title='Floor lamp')
+        self.assertEqual(list(self.search(Product, 'LAM')), [lamp])
+
+    @skipUnless(connection.vendor == 'sqlite', "checks the SQLite query plan")
+    def test_prefix_search_uses_index(self):
+        sql, params = self.search(Product, 'lam').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('api_product_title_ci', plan)
+        self.assertIn('api_product_room_ci', plan)
+
+    def test_numeric_term_matches_ids_exactly(self):
+        user = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        order = Order.objects.create(user=user, address='x')
+        OrderItem.objects.create(order=order, product=make_product(), quantity=1)
+        Order.objects.create(user=user, address='x')
+
+        self.assertEqual(list(self.search(Order, str(order.pk))), [order])
+        self.assertEqual([item.order_id for item in self.search(OrderItem, str(order.pk))], [order.pk])
+
+
+class PopularityCounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('shopper', 'shopper@example.com', 'pw')
+        self.lamp = make_product(title='Lamp')
+        self.rug = make_product(title='Rug')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def counters(self, field):
+        return {product.title: getattr(product, field) for product in Product.objects.order_by('title')}
+
+    def test_wishlist_add_change_and_remove(self):
+        response = self.client.post('/api/wishlist/', {'product_id': self.lamp.pk}, format='json')
+        self.assertEqual(self.counters('wishlist_count'), {'Lamp': 1, 'Rug': 0})
+
+        url = f"/api/wishlist/{response.data['id']}/"
+        self.client.patch(url, {'product_id': self.rug.pk}, format='json')
+        self.assertEqual(self.counters('wishlist_count'), {'Lamp': 0, 'Rug': 1})
+
+        self.client.delete(url)
+        self.assertEqual(self.counters('wishlist_count'), {'Lamp': 0, 'Rug': 0})
+        self.assertFalse(Wishlist.objects.exists())
+
+    def test_checkout_records_units_sold(self):
+        CartItem.objects.create(user=self.user, product=self.lamp, quantity=2)
+        CartItem.objects.create(user=self.user, product=self.rug, quantity=1)
+
+        response = self.client.post('/api/orders/', {'address': 'x'}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.counters('units_sold'), {'Lamp': 2, 'Rug': 1})
+
+    def test_failed_checkout_leaves_counters_unchanged(self):
+        CartItem.objects.create(user=self.user, product=self.lamp, quantity=2)
+        CartItem.objects.create(user=self.user, product=self.rug, quantity=1)
+
+        with mock.patch('api.views.OrderItem.objects.create', side_effect=[OrderItem(), RuntimeError]):
+            with self.assertRaises(RuntimeError):
+                self.client.post('/api/orders/', {'address': 'x'}, format='json')
+
+        self.assertEqual(self.counters('units_sold'), {'Lamp': 0, 'Rug': 0})
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(CartItem.objects.count(), 2)
+
+
+class ArchiveOrdersTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        self.product = make_product()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def make_order(self, status='Delivered', age_days=0):
+        order = Order.objects.create(user=self.user, address='x', status=status)
+        OrderItem.objects.create(order=order, product=self.product, quantity=2)
+        if age_days:
+            Order.objects.filter(pk=order.pk).update(date=timezone.now() - timedelta(days=age_days))
+        return order
+
+    def test_archives_old_delivered_orders_only(self):
+        old = self.make_order(age_days=365)
+        item = old.items.get()
+        pending = self.make_order(status='Pending', age_days=365)
+        recent = self.make_order()
+
+        out = StringIO()
+        call_command('archive_orders', months=6, stdout=out)
+
+        self.assertIn('Archived 1 orders', out.getvalue())
+        self.assertEqual(set(Order.objects.values_list('pk', flat=True)), {pending.pk, recent.pk})
+        self.assertTrue(ArchivedOrder.objects.filter(pk=old.pk).exists())
+        archived_item = ArchivedOrderItem.objects.get(pk=item.pk)
+        self.assertEqual((archived_item.order_id, archived_item.title, archived_item.quantity), (old.pk, 'Lamp', 2))
+
+    def test_list_includes_archive_only_on_request(self):
+        old = [self.make_order(age_days=365) for _ in range(3)]
+        live = self.make_order()
+        call_command('archive_orders', months=6, stdout=StringIO())
+
+        ids = lambda response: [order['id'] for order in response.data]
+        self.assertEqual(ids(self.client.get('/api/orders/')), [live.pk])
+        with override_settings(ARCHIVED_ORDERS_PAGE_SIZE=2):
+            first = self.client.get('/api/orders/?include_archived=1')
+            second = self.client.get(f'/api/orders/?include_archived=1&archived_before={old[1].pk}')
+        self.assertEqual(ids(first), [live.pk, old[2].pk, old[1].pk])
+        self.assertEqual(ids(second), [live.pk, old[0].pk])
+        self.assertEqual(self.client.get('/api/orders/?include_archived=1&archived_before=x').status_code, 400)
+
+    def test_archived_order_matches_live_shape(self):
+        order = self.make_order(age_days=365)
+        live = self.client.get(f'/api/orders/{order.pk}/').data
+        call_command('archive_orders', months=6, stdout=StringIO())
+        archived = self.client.get(f'/api/orders/{order.pk}/').data
+
+        self.assertEqual(archived['items'][0]['product'], live['items'][0]['product'])
+        self.assertEqual(set(archived), set(live) | {'archived'})
+        self.assertEqual(archived['user'], live['user'])
+
+
+class StartupTests(SimpleTestCase):
+    def test_api_workers_defer_optional_modules(self):
+        script = (
+            "import django, json, sys; django.setup(); import api.urls; "
+            "print(json.dumps([m for m in ('api.images', 'api.events', 'api.recommendations') if m in sys.modules]))"
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', script], cwd=settings.BASE_DIR, capture_output=True, text=True,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'deconest_backend.settings_api'},
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(json.loads(result.stdout.splitlines()[-1]), [])
+
+    def test_bench_startup_runs_without_local_data(self):
+        out = StringIO()
+        call_command(
+            'bench_startup', settings_modules=['deconest_backend.settings_api'], runs=1, json=True, stdout=out,
+        )
+        result = json.loads(out.getvalue())['deconest_backend.settings_api']
+        self.assertEqual(result['status'], '200 OK')
+        self.assertGreater(result['rss_mb'], 0)
+
+
+class EventStreamTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pw')
+        self.other = User.objects.create_user('other', 'other@example.com', 'pw')
+        self.order = Order.objects.create(user=self.owner, address='x')
+        self.product = make_product(stock=3)
+
+    def bearer(self, user):
+        return {'headers': {'Authorization': f"Bearer {get_tokens_for_user(user)['access']}"}}
+
+    def ship_order(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order.status = 'Shipped'
+            self.order.save()
+
+    async def test_snapshot_then_committed_change(self):
+        response = await AsyncClient().get(
+            f'/api/events/?orders={self.order.pk}&products={self.product.pk}', **self.bearer(self.owner)
+        )
+        self.assertEqual(response.status_code, 200)
+        frames = response.streaming_content.__aiter__()
+        try:
+            self.assertIn(b'"status": "Pending"', await frames.__anext__())
+            self.assertIn(b'"stock": 3', await frames.__anext__())
+            await sync_to_async(self.ship_order)()
+            self.assertIn(b'"status": "Shipped"', await frames.__anext__())
+        finally:
+            await frames.aclose()
+
+    async def test_order_streams_need_the_owner(self):
+        url = f'/api/events/?orders={self.order.pk}'
+        self.assertEqual((await AsyncClient().get(url)).status_code, 401)
+        self.assertEqual((await AsyncClient().get(url, **self.bearer(self.other))).status_code, 404)
+
+    async def test_query_token_expires(self):
+        url = f'/api/events/?orders={self.order.pk}&token='
+        with mock.patch('django.core.signing.time.time', return_value=time.time() - settings.EVENTS_TOKEN_MAX_AGE - 5):
+            expired = make_events_token(self.owner)
+        self.assertEqual((await AsyncClient().get(url + expired)).status_code, 401)
+
+        response = await AsyncClient().get(url + make_events_token(self.owner))
+        self.assertEqual(response.status_code, 200)
+        await response.streaming_content.__aiter__().aclose()
+
+    def test_token_endpoint_needs_authentication(self):
+        client = APIClient()
+        self.assertEqual(client.post('/api/events/token/').status_code, 401)
+        client.force_authenticate(self.owner)
+        self.assertIn('token', client.post('/api/events/token/').data)
+
+    def test_wsgi_requests_are_refused(self):
+        self.assertEqual(Client().get(f'/api/events/?products={self.product.pk}').status_code, 501)
+
+    def test_broker_outage_does_not_fail_the_save(self):
+        with mock.patch.object(InProcessBroker, 'publish', side_effect=ConnectionError), \
+                self.assertLogs(level='ERROR'):
+            self.ship_order()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'Shipped')
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=0)
+class ProfilingTests(TestCase):
+    def setUp(self):
+        self.product = make_product()
+        self.middleware = ProfilingMiddleware(lambda request: None)
+        self.token = make_profiling_token()
+
+    def request(self, token=None):
+        return RequestFactory().get('/', **({PROFILE_HEADER: token} if token else {}))
+
+    def test_sampling_and_token_gate(self):
+        self.assertFalse(self.middleware._should_profile(self.request()))
+        self.assertTrue(self.middleware._should_profile(self.request(self.token)))
+        self.assertFalse(self.middleware._should_profile(self.request(self.token + 'x')))
+        with override_settings(PROFILING_SAMPLE_RATE=1):
+            self.assertTrue(self.middleware._should_profile(self.request()))
+            self.assertFalse(self.middleware._should_profile(self.request('forged')))
+
+    def test_records_queries_with_their_stack(self):
+        response = Client().get('/api/products/', HTTP_X_PROFILE=self.token)
+
+        record = RequestProfile.objects.get(pk=response['X-Profile-Id'])
+        self.assertEqual((record.method, record.path, record.status_code), ('GET', '/api/products/', 200))
+        query = next(q for q in record.queries if 'FROM "api_product"' in q['sql'])
+        self.assertEqual(record.query_count, len(record.queries))
+        self.assertTrue(query['origin'].startswith('rest_framework/serializers.py'))
+        self.assertIn('rest_framework/mixins.py', ' '.join(query['stack']))
+        self.assertNotIn('in dispatch', ' '.join(frame for frame in query['stack'] if frame.startswith('api/')))
+
+    def test_unprofiled_requests_are_left_alone(self):
+        response = Client().get('/api/products/')
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertFalse(RequestProfile.objects.exists())
+
+    async def test_asgi_profiles_sync_views(self):
+        response = await AsyncClient().get('/api/products/', headers={'X-Profile': self.token})
+        self.assertIn('X-Profile-Id', response)
+        record = await RequestProfile.objects.aget(pk=response['X-Profile-Id'])
+        self.assertTrue(any('FROM "api_product"' in q['sql'] for q in record.queries))
+
+    async def test_asgi_flags_skipped_async_views(self):
+        response = await AsyncClient().get(f'/api/events/?products={self.product.pk}', headers={'X-Profile': self.token})
+        self.assertEqual(response['X-Profile-Skipped'], 'async view')
+        await response.streaming_content.__aiter__().aclose()
+
+    @override_settings(PROFILING_MAX_RECORDS=3)
+    def test_trim_keeps_newest_records(self):
+        records = [
+            RequestProfile.objects.create(method='GET', path=f'/{i}', status_code=200, duration_ms=1)
+            for i in range(5)
+        ]
+        self.middleware._trim()
+        self.assertEqual(list(RequestProfile.objects.order_by('id')), records[2:])
+
+    def test_admin_token_and_download(self):
+        admin = User.objects.create_superuser('root', 'root@example.com', 'pw')
+        staff = User.objects.create_user('staff', 'staff@example.com', 'pw', is_staff=True)
+        record = RequestProfile.objects.create(
+            method='GET', path='/', status_code=200, duration_ms=1, stacks='main;view 3',
+        )
+        client = Client()
+
+        client.force_login(staff)
+        self.assertEqual(client.get('/admin/api/requestprofile/token/').status_code, 403)
+        self.assertEqual(client.get(f'/admin/api/requestprofile/{record.pk}/download/').status_code, 403)
+
+        client.force_login(admin)
+        token = client.get('/admin/api/requestprofile/token/').content.decode()
+        self.assertTrue(self.middleware._should_profile(self.request(token)))
+        download = client.get(f'/admin/api/requestprofile/{record.pk}/download/')
+        self.assertEqual(download.content, b'main;view 3')
+        self.assertIn(f'profile-{record.pk}.folded', download['Content-Disposition'])
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        self.products = {name: make_product(title=name) for name in 'ABCD'}
+
+    def order(self, *names):
+        order = Order.objects.create(user=self.user, address='x')
+        for name in names:
+            OrderItem.objects.create(order=order, product=self.products[name], quantity=1)
+
+    def scores(self, kind='bought'):
+        return {
+            (row.product.title, row.related.title): round(row.score, 6)
+            for row in ProductRecommendation.objects.filter(kind=kind).select_related('product', 'related')
+        }
+
+    def test_top_neighbours_scores(self):
+        # Product 1 is in baskets a, b, c; product 2 in a, b; product 3 in c.
+        pairs = [(1, 1), (1, 2), (2, 1), (2, 2), (3, 1), (3, 3)]
+        neighbours = top_neighbours(pairs, top_k=5)
+
+        self.assertEqual([related for related, _ in neighbours[1]], [2, 3])
+        self.assertAlmostEqual(neighbours[1][0][1], 2 / (3 * 2) ** 0.5)
+        self.assertAlmostEqual(neighbours[1][1][1], 1 / 3 ** 0.5)
+        self.assertEqual([related for related, _ in neighbours[2]], [1])
+        self.assertEqual(top_neighbours(pairs, top_k=1, products=[1]), {1: neighbours[1][:1]})
+
+    def test_counts_override_basket_counts(self):
+        neighbours = top_neighbours([(1, 1), (1, 2)], top_k=5, products=[1], counts={1: 4, 2: 1})
+        self.assertAlmostEqual(neighbours[1][0][1], 1 / 4 ** 0.5)
+
+    def test_incremental_run_matches_full_rebuild(self):
+        self.order('A', 'B')
+        self.order('C', 'A')
+        build_recommendations(full=True)
+        self.order('A', 'D')
+
+        build_recommendations()
+        incremental = self.scores()
+        build_recommendations(full=True)
+
+        self.assertEqual(incremental, self.scores())
+        self.assertAlmostEqual(incremental[('B', 'A')], 1 / 3 ** 0.5, places=5)
+
+    def test_new_wishlist_row_refreshes_the_users_other_products(self):
+        other = User.objects.create_user('other', 'other@example.com', 'pw')
+        Wishlist.objects.create(user=self.user, product=self.products['A'])
+        Wishlist.objects.create(user=self.user, product=self.products['B'])
+        Wishlist.objects.create(user=other, product=self.products['B'])
+        build_recommendations(full=True)
+        Wishlist.objects.create(user=other, product=self.products['C'])
+
+        build_recommendations()
+        incremental = self.scores('wishlisted')
+        build_recommendations(full=True)
+
+        self.assertEqual(incremental, self.scores('wishlisted'))
+        self.assertIn(('B', 'C'), incremental)
+
+    def test_rebuild_invalidates_the_shared_endpoint_cache(self):
+        url = f"/api/products/{self.products['A'].pk}/recommendations/"
+        self.assertEqual(APIClient().get(url).data['bought'], [])
+
+        self.order('A', 'B')
+        build_recommendations()
+
+        self.assertEqual([product['title'] for product in APIClient().get(url).data['bought']], ['B'])
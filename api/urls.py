@@ -10,6 +10,8 @@ from .views import (
     RegisterView,   
     LoginView,      
     LogoutView,     
+    event_stream,
+    EventsTokenView,
 )
 
 router = DefaultRouter()
@@ -27,6 +29,8 @@ urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
     path('login/', LoginView.as_view(), name='login'),
     path('logout/', LogoutView.as_view(), name='logout'),
+    path('events/', event_stream, name='events'),
+    path('events/token/', EventsTokenView.as_view(), name='events_token'),
 
     
     path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
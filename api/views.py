@@ -1,20 +1,134 @@
+import json
+
+from asgiref.sync import sync_to_async
 from rest_framework import viewsets, status, permissions, mixins, serializers
+from rest_framework.decorators import action
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.tokens import RefreshToken
+from django.conf import settings
 from django.contrib.auth import authenticate
+from django.core.cache import cache, caches
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
 from django.db.models import Q
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.views.static import serve
 
-from .models import User, Profile, Product, Wishlist, CartItem, Order, OrderItem
+from .idempotency import IdempotentCreateMixin
+from .models import (
+    User, Profile, Product, Wishlist, CartItem, Order, OrderItem, ArchivedOrder, ProductRecommendation,
+)
+from .popularity import record_wishlist_add, record_wishlist_remove, record_units_sold
+from .routers import ReplicaReadMixin
 from .serializers import (
     UserSerializer,
     ProductSerializer,
     WishlistSerializer,
     CartItemSerializer,
     OrderSerializer,
+    ArchivedOrderSerializer,
 )
 
 
+def serve_media(request, path):
+    """Local media for development; names are content hashed so they can be cached forever."""
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+def _parse_ids(value):
+    return [int(part) for part in value.split(',') if part.strip()] if value else []
+
+
+def _event_frame(message):
+    return f"event: {message['type']}\ndata: {json.dumps(message)}\n\n"
+
+
+async def _event_stream_user(request):
+    from .events import user_id_from_events_token
+
+    token = request.GET.get('token')
+    if token:
+        user_id = user_id_from_events_token(token)
+        return await User.objects.filter(pk=user_id, is_active=True).afirst() if user_id else None
+    try:
+        auth = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except AuthenticationFailed:
+        return None
+    return auth[0] if auth else None
+
+
+async def event_stream(request):
+    """
+    Server-sent events for `?orders=1,2&products=3`.
+
+    Sends the current status/stock first, then every change as it is
+    committed. Order streams need the owner (or staff), authenticated with
+    a JWT or a `?token=` from /api/events/token/; product stock is public.
+    Only served under ASGI: a WSGI worker would buffer the endless stream.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'error': 'Event streams need the ASGI server'}, status=501)
+    try:
+        order_ids = _parse_ids(request.GET.get('orders'))
+        product_ids = _parse_ids(request.GET.get('products'))
+    except ValueError:
+        return JsonResponse({'error': 'orders and products must be comma separated ids'}, status=400)
+    if not order_ids and not product_ids:
+        return JsonResponse({'error': 'Subscribe to at least one order or product'}, status=400)
+    if len(order_ids) + len(product_ids) > settings.EVENTS_MAX_SUBSCRIPTIONS:
+        return JsonResponse({'error': 'Too many subscriptions'}, status=400)
+
+    if order_ids:
+        user = await _event_stream_user(request)
+        if user is None:
+            return JsonResponse({'error': 'Authentication required for order events'}, status=401)
+        queryset = Order.objects.filter(id__in=order_ids)
+        if not (user.is_staff or getattr(user, 'role', None) == 'admin'):
+            queryset = queryset.filter(user=user)
+        if await queryset.acount() != len(set(order_ids)):
+            return JsonResponse({'error': 'Order not found'}, status=404)
+
+    from .events import get_broker, order_channel, product_channel
+
+    channels = [order_channel(pk) for pk in order_ids] + [product_channel(pk) for pk in product_ids]
+
+    async def stream():
+        # Subscribe before reading the snapshot so no change can slip in between.
+        subscription = get_broker().subscribe(channels)
+        try:
+            await subscription.open()
+            async for order in Order.objects.filter(id__in=order_ids).only('id', 'status'):
+                yield _event_frame({'type': 'order.status', 'id': order.id, 'status': order.status})
+            async for product in Product.objects.filter(id__in=product_ids).only('id', 'stock'):
+                yield _event_frame({'type': 'product.stock', 'id': product.id, 'stock': product.stock})
+            while True:
+                message = await subscription.get(timeout=settings.EVENTS_KEEPALIVE_SECONDS)
+                yield _event_frame(message) if message is not None else ": keepalive\n\n"
+        finally:
+            await subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+class EventsTokenView(APIView):
+    """Short-lived token for `/api/events/?token=`, since EventSource can't set headers."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        from .events import make_events_token
+
+        return Response({'token': make_events_token(request.user), 'expires_in': settings.EVENTS_TOKEN_MAX_AGE})
+
+
 def get_tokens_for_user(user):
     refresh = RefreshToken.for_user(user)
     return {
@@ -80,12 +194,13 @@ class UserViewSet(viewsets.ModelViewSet):
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAdminUser]
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    replica_actions = ('list', 'retrieve', 'trending', 'top_sellers', 'recommendations')
 
     def get_queryset(self):
-        queryset = Product.objects.filter(is_archived=False)
+        queryset = Product.objects.filter(is_archived=False).select_related('image_asset')
         search = self.request.query_params.get('search')
         if search:
             queryset = queryset.filter(
@@ -96,35 +211,92 @@ class ProductViewSet(viewsets.ModelViewSet):
         return queryset
 
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'trending', 'top_sellers', 'recommendations']:
             permission_classes = [permissions.AllowAny]
         else:
             permission_classes = [permissions.IsAdminUser]
         return [perm() for perm in permission_classes]
 
+    def _ranked(self, cache_key, order_by):
+        data = cache.get(cache_key)
+        if data is None:
+            products = Product.objects.filter(is_archived=False).select_related('image_asset').order_by(order_by, '-id')[:settings.POPULARITY_LIMIT]
+            data = self.get_serializer(products, many=True).data
+            cache.set(cache_key, data, timeout=settings.POPULARITY_CACHE_SECONDS)
+        return Response(data)
+
+    @action(detail=False)
+    def trending(self, request):
+        """Most wishlisted products."""
+        return self._ranked('products:trending', '-wishlist_count')
+
+    @action(detail=False, url_path='top-sellers')
+    def top_sellers(self, request):
+        """Products with the most units ordered."""
+        return self._ranked('products:top-sellers', '-units_sold')
+
+    @action(detail=True)
+    def recommendations(self, request, pk=None):
+        """Frequently bought together / also wishlisted, from the build_recommendations table."""
+        from .recommendations import recommendations_cache_key
+
+        # Shared so build_recommendations, running in its own process, can invalidate it.
+        shared = caches['shared']
+        cache_key = recommendations_cache_key(pk)
+        data = shared.get(cache_key)
+        if data is None:
+            product = self.get_object()
+            recommendations = (
+                ProductRecommendation.objects.filter(product=product, related__is_archived=False)
+                .select_related('related__image_asset')
+                .order_by('kind', 'rank')
+            )
+            data = {kind: [] for kind, _ in ProductRecommendation.KIND_CHOICES}
+            for recommendation in recommendations:
+                data[recommendation.kind].append(self.get_serializer(recommendation.related).data)
+            shared.set(cache_key, data, timeout=settings.RECOMMENDATIONS_CACHE_SECONDS)
+        return Response(data)
+
 
-class WishlistViewSet(viewsets.ModelViewSet):
+class WishlistViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     serializer_class = WishlistSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Wishlist.objects.filter(user=self.request.user)
+        return Wishlist.objects.filter(user=self.request.user).select_related('product__image_asset')
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        with transaction.atomic():
+            wishlist = serializer.save(user=self.request.user)
+            record_wishlist_add(wishlist.product_id)
+
+    def perform_update(self, serializer):
+        previous_product_id = serializer.instance.product_id
+        with transaction.atomic():
+            wishlist = serializer.save()
+            if wishlist.product_id != previous_product_id:
+                record_wishlist_remove(previous_product_id)
+                record_wishlist_add(wishlist.product_id)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            record_wishlist_remove(instance.product_id)
 
 
-class CartItemViewSet(viewsets.ModelViewSet):
+class CartItemViewSet(IdempotentCreateMixin, viewsets.ModelViewSet):
     serializer_class = CartItemSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return CartItem.objects.filter(user=self.request.user)
+        return CartItem.objects.filter(user=self.request.user).select_related('product__image_asset')
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class OrderViewSet(mixins.ListModelMixin,
+class OrderViewSet(IdempotentCreateMixin,
+                   ReplicaReadMixin,
+                   mixins.ListModelMixin,
                    mixins.CreateModelMixin,
                    mixins.RetrieveModelMixin,
                    viewsets.GenericViewSet):
@@ -133,9 +305,43 @@ class OrderViewSet(mixins.ListModelMixin,
 
     def get_queryset(self):
         user = self.request.user
+        queryset = Order.objects.prefetch_related('items__product__image_asset')
+        if user.is_staff or getattr(user, 'role', None) == 'admin':
+            return queryset
+        return queryset.filter(user=user)
+
+    def get_archived_queryset(self):
+        user = self.request.user
+        queryset = ArchivedOrder.objects.prefetch_related('items__product__image_asset').order_by('-id')
         if user.is_staff or getattr(user, 'role', None) == 'admin':
-            return Order.objects.all()
-        return Order.objects.filter(user=user)
+            return queryset
+        return queryset.filter(user=user)
+
+    def list(self, request, *args, **kwargs):
+        """
+        Live orders. With `?include_archived=1`, also up to ARCHIVED_ORDERS_PAGE_SIZE
+        archived orders, newest first; pass `archived_before=<id>` for the next page.
+        """
+        response = super().list(request, *args, **kwargs)
+        if request.query_params.get('include_archived') not in ('1', 'true'):
+            return response
+        archived = self.get_archived_queryset()
+        before = request.query_params.get('archived_before')
+        if before:
+            if not before.isdigit():
+                raise serializers.ValidationError({'archived_before': 'Must be an order id.'})
+            archived = archived.filter(id__lt=int(before))
+        archived = archived[:settings.ARCHIVED_ORDERS_PAGE_SIZE]
+        serialized = ArchivedOrderSerializer(archived, many=True, context=self.get_serializer_context()).data
+        response.data = list(response.data) + list(serialized)
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            archived = get_object_or_404(self.get_archived_queryset(), pk=kwargs['pk'])
+            return Response(ArchivedOrderSerializer(archived, context=self.get_serializer_context()).data)
 
     def perform_create(self, serializer):
         cart_items = CartItem.objects.filter(user=self.request.user)
@@ -143,13 +349,15 @@ class OrderViewSet(mixins.ListModelMixin,
             raise serializers.ValidationError("Cart is empty.")
 
         total = sum(item.product.price * item.quantity for item in cart_items)
-        order = serializer.save(user=self.request.user, total=total)
-
-        for item in cart_items:
-            OrderItem.objects.create(
-                order=order,
-                product=item.product,
-                quantity=item.quantity
-            )
-
-        cart_items.delete()
+        with transaction.atomic():
+            order = serializer.save(user=self.request.user, total=total)
+
+            for item in cart_items:
+                OrderItem.objects.create(
+                    order=order,
+                    product=item.product,
+                    quantity=item.quantity
+                )
+                record_units_sold(item.product_id, item.quantity)
+
+            cart_items.delete()
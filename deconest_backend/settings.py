@@ -61,17 +61,76 @@ SIMPLE_JWT = {
 AUTH_USER_MODEL = 'api.User'
 
 
+# 'default' is per process and only holds data that is safe to recompute.
+# 'shared' must be visible to every worker: it holds idempotency keys, their
+# locks and the recommendations endpoint cache that build_recommendations clears. The database table is created by a migration; point it at
+# Redis or memcached in production if the database gets too busy.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'deconest',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'api_shared_cache',
+    },
+}
+
+# Idempotency-Key support for order creation and cart writes
+IDEMPOTENCY_KEY_TTL = 60 * 60 * 24
+IDEMPOTENCY_LOCK_TIMEOUT = 30
+
+# Trending / top-sellers product endpoints
+POPULARITY_LIMIT = 20
+POPULARITY_CACHE_SECONDS = 60 * 5
+
+# "Customers also bought" recommendations, refreshed by build_recommendations
+RECOMMENDATIONS_TOP_K = 10
+RECOMMENDATIONS_CACHE_SECONDS = 60 * 60
+
+# Server-sent events for order status and product stock (/api/events/).
+# The stream needs an ASGI server (e.g. uvicorn deconest_backend.asgi:application).
+# InProcessBroker only reaches clients of the process that made the change, so
+# it suits a single ASGI worker where all writes (API, admin, management
+# commands) happen in that same process. Anything else needs 'api.events.RedisBroker'.
+EVENTS_BROKER = 'api.events.InProcessBroker'
+EVENTS_REDIS_URL = 'redis://localhost:6379/0'
+EVENTS_QUEUE_SIZE = 100
+EVENTS_KEEPALIVE_SECONDS = 15
+EVENTS_MAX_SUBSCRIPTIONS = 50
+# Lifetime of the ?token= issued by /api/events/token/ for browser EventSource.
+EVENTS_TOKEN_MAX_AGE = 60
+
+# Request profiling (api.profiling). Sampled requests and requests with a
+# signed X-Profile header are profiled; get a header value from the
+# Request profiles admin ("token/").
+PROFILING_ENABLED = True
+PROFILING_SAMPLE_RATE = 0.001
+PROFILING_INTERVAL = 0.005
+PROFILING_TOKEN_MAX_AGE = 60 * 60
+PROFILING_MAX_RECORDS = 200
+PROFILING_MAX_STACKS = 2000
+PROFILING_MAX_QUERIES = 500
+# Frames from our code and DRF kept with each recorded query
+PROFILING_QUERY_FRAMES = 8
+
+# Delivered orders older than this are moved to the archive tables by archive_orders
+ORDER_ARCHIVE_AFTER_MONTHS = 6
+# Archived orders returned per /api/orders/?include_archived=1 request
+ARCHIVED_ORDERS_PAGE_SIZE = 20
+
+
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'api.profiling.ProfilingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-        
-    'django.middleware.security.SecurityMiddleware',
 ]
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",  # if you're using Vite
@@ -109,9 +168,23 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    },
+    # Local stand-in for a read replica, refreshed with `manage.py sync_replica`.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_replica.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
+DATABASE_ROUTERS = ['api.routers.PrimaryReplicaRouter']
+# Only read from the local replica once sync_replica has created it
+DATABASE_REPLICAS = ['replica'] if (BASE_DIR / 'db_replica.sqlite3').exists() else []
+
+# How long a user's reads stay on the primary after they write something
+# (a signed cookie set on the write response)
+REPLICA_STICKY_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -149,6 +222,26 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Product images are copied into the default storage by process_images.
+# For production point STORAGES['default'] at an S3-compatible backend and
+# MEDIA_URL at the CDN in front of it.
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+IMAGE_VARIANT_WIDTHS = [320, 640, 1280]
+IMAGE_VARIANT_FORMATS = ['avif', 'webp']
+# file:// sources let the worker read local files into public media, so they
+# are off unless explicitly enabled (offline development and tests only).
+IMAGE_ALLOW_FILE_URLS = False
+IMAGE_SOURCE_SCHEMES = ['http', 'https']
+IMAGE_CLAIM_TIMEOUT = 10 * 60
+# Network errors and 5xx/429 responses are retried with exponential backoff
+# (IMAGE_RETRY_BACKOFF seconds, doubling) before the asset is marked failed.
+IMAGE_MAX_ATTEMPTS = 5
+IMAGE_RETRY_BACKOFF = 60
+IMAGE_FETCH_TIMEOUT = 10
+IMAGE_MAX_SOURCE_BYTES = 20 * 1024 * 1024
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
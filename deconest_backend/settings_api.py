@@ -0,0 +1,35 @@
+"""
+Settings for JSON-only API workers.
+
+Drops the admin, sessions, messages, static files and templates, plus the
+middleware that only serves them. Clients authenticate with JWT, so CSRF
+and session middleware are not needed. Select it with
+DJANGO_SETTINGS_MODULE=deconest_backend.settings_api.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+
+INSTALLED_APPS = [
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'rest_framework',
+    'corsheaders',
+    'api.apps.ApiConfig',
+]
+
+MIDDLEWARE = [
+    'corsheaders.middleware.CorsMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'api.profiling.ProfilingMiddleware',
+    'django.middleware.common.CommonMiddleware',
+]
+
+ROOT_URLCONF = 'deconest_backend.urls_api'
+
+TEMPLATES = []
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,  # noqa: F405
+    'DEFAULT_RENDERER_CLASSES': ('rest_framework.renderers.JSONRenderer',),
+}